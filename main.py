@@ -4,16 +4,26 @@ Automatic Nametag STL Generator
 Reads names from a CSV file and generates individual STL files using OpenSCAD
 """
 
+import argparse
 import csv
+import functools
+import hashlib
+import shutil
+import string
 import subprocess
 import os
 import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
 # Configuration
 OPENSCAD_TEMPLATE = "nametag.scad"
 OUTPUT_DIR = "generated_nametags"
 CSV_FILE = "names.csv"
+SCAD_LIBRARY = "nametag_lib.scad"
+EXPORT_FORMAT = "binstl"  # binary STL is much smaller and faster to write than ASCII STL
+CACHE_DIR = ".nametag_cache"
+OPENSCAD_PATH_CACHE = Path.home() / ".cache" / "nametag" / "openscad_path"
 
 # Default nametag parameters (can be overridden in CSV)
 DEFAULT_PARAMS = {
@@ -28,50 +38,19 @@ DEFAULT_PARAMS = {
     "corner_radius": 3,
 }
 
+# Precomputed once so each CSV row doesn't have to walk DEFAULT_PARAMS again
+_DEFAULT_ITEMS = tuple(DEFAULT_PARAMS.items())
+_DEFAULT_KEYS = tuple(DEFAULT_PARAMS)
 
-def find_openscad():
-    """Find OpenSCAD executable on the system"""
-    possible_paths = [
-        "openscad",  # Linux/Mac if in PATH
-        "/usr/bin/openscad",  # Linux
-        "/usr/local/bin/openscad",  # Linux/Mac
-        "C:\\Program Files\\OpenSCAD\\openscad.exe",  # Windows
-        "C:\\Program Files (x86)\\OpenSCAD\\openscad.exe",  # Windows 32-bit
-        "/Applications/OpenSCAD.app/Contents/MacOS/OpenSCAD",  # macOS
-    ]
-
-    for path in possible_paths:
-        try:
-            result = subprocess.run([path, "--version"], capture_output=True, timeout=5)
-            if result.returncode == 0:
-                print(f"Found OpenSCAD at: {path}")
-                return path
-        except (FileNotFoundError, subprocess.TimeoutExpired, PermissionError):
-            continue
-
-    return None
-
-
-def create_temp_scad(name, params, temp_file):
-    """Create a temporary OpenSCAD file with the given parameters"""
-    scad_content = f"""// Auto-generated nametag for: {name}
-
-// Parameters
-name = "{name}";
-nametag_width = {params["nametag_width"]};
-nametag_height = {params["nametag_height"]};
-nametag_thickness = {params["nametag_thickness"]};
-text_size = {params["text_size"]};
-text_height = {params["text_height"]};
-ring_width = {params["ring_width"]};
-ring_height = {params["ring_height"]};
-mounting_hole_diameter = {params["mounting_hole_diameter"]};
-corner_radius = {params["corner_radius"]};
 
+# Module definitions shared by all generated nametags. Together with the parameter
+# header below they form one SCAD file that is written once per run; OpenSCAD renders
+# it for every name with the per-name values passed as -D overrides.
+_SCAD_LIBRARY = """
 // Main nametag module
-module nametag() {{
-    difference() {{
-        union() {{
+module nametag() {
+    difference() {
+        union() {
             // Main body: rectangle on one side, semicircle on the other
             nametag_body(nametag_width, nametag_height, nametag_thickness, corner_radius);
             
@@ -82,17 +61,17 @@ module nametag() {{
             translate([nametag_width/2, nametag_height/2, nametag_thickness])
                 linear_extrude(height = text_height)
                     text(name, size = text_size, halign = "center", valign = "center", font = "Liberation Sans:style=Bold");
-        }}
+        }
         
         // Mounting hole in the center of the circular side
         translate([nametag_width, nametag_height/2, -0.5])
             cylinder(h = nametag_thickness + ring_height + text_height + 1, d = mounting_hole_diameter, $fn = 30);
-    }}
-}}
+    }
+}
 
 // Module to create the main body shape (rectangle + semicircle)
-module nametag_body(width, height, thickness, radius) {{
-    hull() {{
+module nametag_body(width, height, thickness, radius) {
+    hull() {
         // Rectangular side with rounded corners (left side)
         translate([radius, radius, 0])
             cylinder(r = radius, h = thickness, $fn = 30);
@@ -102,15 +81,15 @@ module nametag_body(width, height, thickness, radius) {{
         // Semicircle on the right side
         translate([width, height/2, 0])
             cylinder(r = height/2, h = thickness, $fn = 60);
-    }}
-}}
+    }
+}
 
 // Module to create the elevated ring
-module elevated_ring(width, height, thickness, ring_w, ring_h, radius) {{
-    difference() {{
+module elevated_ring(width, height, thickness, ring_w, ring_h, radius) {
+    difference() {
         // Outer shape (same as body but elevated)
         translate([0, 0, thickness])
-            hull() {{
+            hull() {
                 // Rectangular side with rounded corners
                 translate([radius, radius, 0])
                     cylinder(r = radius, h = ring_h, $fn = 30);
@@ -120,11 +99,11 @@ module elevated_ring(width, height, thickness, ring_w, ring_h, radius) {{
                 // Semicircle on the right side
                 translate([width, height/2, 0])
                     cylinder(r = height/2, h = ring_h, $fn = 60);
-            }}
+            }
         
         // Inner cutout (smaller shape)
         translate([0, 0, thickness - 0.5])
-            hull() {{
+            hull() {
                 // Inner rectangular side
                 translate([radius + ring_w, radius + ring_w, 0])
                     cylinder(r = radius, h = ring_h + 1, $fn = 30);
@@ -134,102 +113,331 @@ module elevated_ring(width, height, thickness, ring_w, ring_h, radius) {{
                 // Inner semicircle (smaller radius)
                 translate([width, height/2, 0])
                     cylinder(r = height/2 - ring_w, h = ring_h + 1, $fn = 60);
-            }}
-    }}
-}}
+            }
+    }
+}
 
 // Generate the nametag
 nametag();
 """
 
-    with open(temp_file, "w", encoding="utf-8") as f:
-        f.write(scad_content)
 
+# Parameter header of the shared SCAD file, filled in with the defaults.
+# string.Template keeps the placeholders apart from OpenSCAD's own braces.
+_SCAD_TEMPLATE = string.Template("""// Auto-generated nametag library
+// The values below are defaults; main.py overrides them for each name with -D
+
+// Parameters
+name = "$name";
+nametag_width = $nametag_width;
+nametag_height = $nametag_height;
+nametag_thickness = $nametag_thickness;
+text_size = $text_size;
+text_height = $text_height;
+ring_width = $ring_width;
+ring_height = $ring_height;
+mounting_hole_diameter = $mounting_hole_diameter;
+corner_radius = $corner_radius;
+""")
+
+# Complete shared SCAD file; its content is also part of every cache key
+_SCAD_SOURCE = _SCAD_TEMPLATE.substitute(DEFAULT_PARAMS, name="YOUR NAME") + _SCAD_LIBRARY
+
+# Hash state of the shared SCAD file, computed once and copied for every cache key
+_SCAD_DIGEST = hashlib.blake2b(_SCAD_SOURCE.encode("utf-8"), digest_size=16)
+
+
+def read_cached_openscad():
+    """Return the remembered OpenSCAD path if it is still executable"""
+    try:
+        path = OPENSCAD_PATH_CACHE.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    if path and os.path.isfile(path) and os.access(path, os.X_OK):
+        return path
+    return None
+
+
+def write_cached_openscad(path):
+    """Remember the OpenSCAD path for the next run"""
+    # Store the resolved location so the cached entry can be validated without PATH lookups
+    resolved = shutil.which(path) or path
+    try:
+        OPENSCAD_PATH_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        OPENSCAD_PATH_CACHE.write_text(resolved, encoding="utf-8")
+    except OSError:
+        # The cache is only an optimization, so failing to write it is not an error
+        pass
+
+
+@functools.lru_cache(maxsize=1)
+def find_openscad(refresh=False):
+    """Find OpenSCAD executable on the system"""
+    # A PATH lookup needs no subprocess, so try it before anything else
+    path = shutil.which("openscad")
+    if path:
+        print(f"Found OpenSCAD at: {path}")
+        return path
+
+    if not refresh:
+        path = read_cached_openscad()
+        if path:
+            print(f"Found OpenSCAD at: {path} (cached)")
+            return path
+
+    possible_paths = [
+        "/usr/bin/openscad",  # Linux
+        "/usr/local/bin/openscad",  # Linux/Mac
+        "C:\\Program Files\\OpenSCAD\\openscad.exe",  # Windows
+        "C:\\Program Files (x86)\\OpenSCAD\\openscad.exe",  # Windows 32-bit
+        "/Applications/OpenSCAD.app/Contents/MacOS/OpenSCAD",  # macOS
+    ]
+
+    for path in possible_paths:
+        try:
+            # A working install prints its version almost instantly
+            result = subprocess.run([path, "-v"], capture_output=True, timeout=2)
+            if result.returncode == 0:
+                print(f"Found OpenSCAD at: {path}")
+                write_cached_openscad(path)
+                return path
+        except (FileNotFoundError, subprocess.TimeoutExpired, PermissionError):
+            continue
+
+    return None
+
+
+def write_scad_library(output_dir):
+    """Write the shared OpenSCAD file used for every nametag and return its path"""
+    library_path = output_dir / SCAD_LIBRARY
+    library_path.write_text(_SCAD_SOURCE, encoding="utf-8")
+    return library_path
+
+
+def scad_defines(name, params):
+    """Return the OpenSCAD -D arguments that set the parameters for one nametag"""
+    # The name becomes an OpenSCAD string literal, so quotes and backslashes need escaping
+    escaped_name = name.replace("\\", "\\\\").replace('"', '\\"')
+    defines = ["-D", f'name="{escaped_name}"']
+    for key in _DEFAULT_KEYS:
+        # Always format as float so a default of 80 and a CSV value of "80" give the same define
+        defines += ["-D", f"{key}={float(params[key])}"]
+    return defines
 
+
+class _FilenameTable(dict):
+    """str.translate table that keeps letters, digits, spaces, '-' and '_' and maps everything else to '_'"""
+
+    def __missing__(self, codepoint):
+        # Characters are classified on first use and then remembered, which also covers non-ASCII names
+        char = chr(codepoint)
+        mapped = codepoint if char.isalnum() or char in " -_" else ord("_")
+        self[codepoint] = mapped
+        return mapped
+
+
+_FILENAME_TABLE = _FilenameTable()
+
+
+@functools.lru_cache(maxsize=4096)
 def sanitize_filename(name):
     """Create a safe filename from a name"""
     # Remove or replace characters that aren't safe for filenames
-    safe_name = "".join(c if c.isalnum() or c in (" ", "-", "_") else "_" for c in name)
+    safe_name = name.translate(_FILENAME_TABLE)
     safe_name = safe_name.strip().replace(" ", "_")
     return safe_name
 
 
-def generate_stl(openscad_path, name, params, output_dir):
-    """Generate an STL file for a given name"""
-    safe_name = sanitize_filename(name)
-    temp_scad = os.path.join(output_dir, f"temp_{safe_name}.scad")
-    output_stl = os.path.join(output_dir, f"{safe_name}.stl")
+def unique_filename(name, used_filenames):
+    """Return an output filename for a name that no earlier row of this run has taken"""
+    base = sanitize_filename(name)
+    filename = base
+    counter = 2
+    # Compare case-insensitively, since Windows and macOS treat "Bob" and "bob" as the same file
+    while filename.casefold() in used_filenames:
+        filename = f"{base}_{counter}"
+        counter += 1
+    used_filenames[filename.casefold()] = name
+    return filename
+
+
+def cache_key(defines):
+    """Return a stable hash of everything OpenSCAD is given to render one nametag"""
+    digest = _SCAD_DIGEST.copy()
+    digest.update("\0".join([EXPORT_FORMAT, *defines]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def store_in_cache(output_stl, cached_stl):
+    """Copy a freshly generated STL into the cache"""
+    # Write to a temporary name first so parallel workers never see a partial file
+    temp_stl = cached_stl.with_name(f"{cached_stl.name}.{os.getpid()}.tmp")
+    try:
+        cached_stl.parent.mkdir(exist_ok=True)
+        shutil.copyfile(output_stl, temp_stl)
+        os.replace(temp_stl, cached_stl)
+    except OSError:
+        # The cache is only an optimization, so failing to fill it is not an error
+        try:
+            temp_stl.unlink()
+        except OSError:
+            pass
+
+
+def write_fingerprint(fingerprint, key):
+    """Record the cache key an output STL was made from"""
+    try:
+        fingerprint.write_text(key, encoding="utf-8")
+    except OSError:
+        # Without a fingerprint the STL is simply regenerated on the next run
+        pass
+
+
+def generate_stl(openscad_path, name, filename, defines, key, output_dir, use_cache=True):
+    """Generate <filename>.stl for a given name and return (success, status message)"""
+    output_stl = output_dir / f"{filename}.stl"
+    library_path = output_dir / SCAD_LIBRARY
+    cached_stl = Path(CACHE_DIR) / f"{key}.stl"
+    # Records the cache key the current output was made from, so a changed row only
+    # invalidates its own STL
+    fingerprint = output_dir / f".{filename}.fp"
+
+    status = f"Generating STL for: {name}..."
+
+    if use_cache:
+        # Leave the STL alone if it was already generated from the same inputs
+        try:
+            if fingerprint.read_text(encoding="utf-8") == key and output_stl.exists():
+                return True, f"{status} ✓ Up to date"
+        except (OSError, ValueError):
+            # A missing, unreadable or corrupt fingerprint just means the STL is rebuilt
+            pass
+
+    # The output is about to change, so its old fingerprint no longer applies
+    try:
+        fingerprint.unlink()
+    except OSError:
+        pass
+
+    # Reuse a previously generated STL for the same name and parameters
+    if use_cache:
+        try:
+            shutil.copyfile(cached_stl, output_stl)
+        except OSError:
+            # Not cached, or the cached copy can't be used; render it instead
+            pass
+        else:
+            write_fingerprint(fingerprint, key)
+            return True, f"{status} ✓ Cached"
 
-    # Create temporary SCAD file
-    create_temp_scad(name, params, temp_scad)
+    # OpenSCAD renders into a file that belongs to this job only. The cache is filled
+    # from it, never from the output path, which another row could be writing as well.
+    rendered_stl = output_dir / f".{key}.{os.getpid()}.tmp.stl"
 
-    # Generate STL using OpenSCAD
-    print(f"Generating STL for: {name}...", end=" ")
+    # Generate STL using OpenSCAD; every name renders the same shared SCAD file
     try:
         result = subprocess.run(
-            [openscad_path, "-o", output_stl, temp_scad],
-            capture_output=True,
+            [openscad_path, "-o", str(rendered_stl), "--export-format", EXPORT_FORMAT, *defines, str(library_path)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             timeout=60,
-            text=True,
         )
 
-        if result.returncode == 0 and os.path.exists(output_stl):
-            print("✓ Success")
-            # Clean up temporary file
-            os.remove(temp_scad)
-            return True
+        if result.returncode == 0 and rendered_stl.exists():
+            if use_cache:
+                store_in_cache(rendered_stl, cached_stl)
+            os.replace(rendered_stl, output_stl)
+            write_fingerprint(fingerprint, key)
+            return True, f"{status} ✓ Success"
         else:
-            print("✗ Failed")
+            message = f"{status} ✗ Failed"
             if result.stderr:
-                print(f"  Error: {result.stderr}")
-            return False
+                # Only decode OpenSCAD's output when it is actually shown
+                message += f"\n  Error: {result.stderr.decode('utf-8', 'replace')}"
+            return False, message
     except subprocess.TimeoutExpired:
-        print("✗ Timeout")
-        return False
+        return False, f"{status} ✗ Timeout"
     except Exception as e:
-        print(f"✗ Error: {e}")
-        return False
+        return False, f"{status} ✗ Error: {e}"
+    finally:
+        # Don't leave a partial render behind after a failure or timeout
+        try:
+            rendered_stl.unlink()
+        except FileNotFoundError:
+            pass
 
 
-def read_csv(csv_file):
-    """Read names and optional parameters from CSV file"""
-    names_data = []
+# OpenSCAD path of a worker process, set once by _init_worker
+_OPENSCAD = None
+
 
+def _init_worker(openscad_path):
+    """Remember the OpenSCAD path found by the parent process in a pool worker"""
+    global _OPENSCAD
+    _OPENSCAD = openscad_path
+
+
+def _worker(name, filename, defines, key, output_dir, use_cache):
+    """Run generate_stl in a pool worker with the OpenSCAD path set by _init_worker"""
+    return generate_stl(_OPENSCAD, name, filename, defines, key, output_dir, use_cache)
+
+
+def read_csv(csv_file):
+    """Read names and optional parameters from CSV file, yielding one row at a time"""
     with open(csv_file, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+
+        header = next(reader, None)
+        if header is None:
+            return
+        if "name" not in header:
+            raise ValueError("CSV file has no 'name' column")
+
+        # Look up column positions once instead of building a dict per row
+        name_idx = header.index("name")
+        param_idx = tuple((key, header.index(key)) for key in _DEFAULT_KEYS if key in header)
 
         for row in reader:
-            # get name safely (row.get can return None)
-            raw_name = row.get("name") if row is not None else None
-            if raw_name is None or str(raw_name).strip() == "":
-                # skip rows without a valid name
+            # skip rows without a valid name (short rows have no name cell)
+            if name_idx >= len(row):
+                continue
+            name = row[name_idx].strip()
+            if not name:
                 continue
-            name = str(raw_name).strip()
 
             # Start with default parameters
-            params = DEFAULT_PARAMS.copy()
+            params = dict(_DEFAULT_ITEMS)
 
-            # Override with CSV values if provided, but handle None/empty gracefully
-            for key in DEFAULT_PARAMS.keys():
-                raw_val = row.get(key) if row is not None else None
-                if raw_val is None:
-                    continue
-                sval = str(raw_val).strip()
-                if sval == "":
-                    continue
+            # Override with CSV values if provided; missing, empty or
+            # non-numeric values keep the default
+            for key, idx in param_idx:
                 try:
                     # keep numeric defaults as floats
-                    params[key] = float(sval)
-                except ValueError:
-                    # if conversion fails, keep default
+                    params[key] = float(row[idx].strip())
+                except (ValueError, IndexError):
                     continue
 
-            names_data.append({"name": name, "params": params})
+            yield {"name": name, "params": params}
+
 
-    return names_data
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate nametag STL files from a CSV file using OpenSCAD")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"always run OpenSCAD instead of keeping up-to-date STLs or reusing STLs from '{CACHE_DIR}'",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="search for OpenSCAD again instead of using the remembered path",
+    )
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+
     print("=" * 60)
     print("Automatic Nametag STL Generator")
     print("=" * 60)
@@ -247,7 +455,7 @@ def main():
         sys.exit(1)
 
     # Find OpenSCAD
-    openscad_path = find_openscad()
+    openscad_path = find_openscad(refresh=args.refresh)
     if not openscad_path:
         print("Error: OpenSCAD not found!")
         print("\nPlease install OpenSCAD from: https://openscad.org/downloads.html")
@@ -255,34 +463,89 @@ def main():
         sys.exit(1)
 
     # Create output directory
-    Path(OUTPUT_DIR).mkdir(exist_ok=True)
+    output_dir = Path(OUTPUT_DIR)
+    output_dir.mkdir(exist_ok=True)
+    write_scad_library(output_dir)
     print(f"Output directory: {OUTPUT_DIR}")
     print()
 
-    # Read names from CSV
-    try:
-        names_data = read_csv(CSV_FILE)
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        sys.exit(1)
-
-    if not names_data:
-        print("Error: No valid names found in CSV file!")
-        sys.exit(1)
-
-    print(f"Found {len(names_data)} name(s) to process")
+    # Generate STL for each name, one OpenSCAD process per CPU core
+    workers = os.cpu_count() or 1
+    if os.name == "nt":
+        # ProcessPoolExecutor on Windows rejects more than 61 workers
+        workers = min(workers, 61)
+    print(f"Using up to {workers} worker process(es)")
     print()
 
-    # Generate STL for each name
     successful = 0
     failed = 0
 
-    for i, data in enumerate(names_data, 1):
-        print(f"[{i}/{len(names_data)}] ", end="")
-        if generate_stl(openscad_path, data["name"], data["params"], OUTPUT_DIR):
-            successful += 1
-        else:
-            failed += 1
+    # Rows are streamed from the CSV into the worker pool, so the first OpenSCAD run
+    # starts as soon as the first row has been parsed. At most max_pending jobs are
+    # queued at a time; once the window is full, finished jobs are reported before
+    # the next row is read, so memory stays bounded and progress shows up right away.
+    # Rows whose OpenSCAD inputs hash the same as an earlier row would produce the
+    # same file and are only submitted once. Different names that sanitize to the
+    # same filename get a numbered suffix so they never overwrite each other's output.
+    max_pending = 2 * workers
+    pending = {}
+    seen_keys = set()
+    used_filenames = {}
+    rows = read_csv(CSV_FILE)
+    rows_left = True
+    # Workers get the already validated OpenSCAD path once at startup instead of with every task
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(openscad_path,)) as executor:
+        while rows_left or pending:
+            if rows_left and len(pending) < max_pending:
+                # Only reading the next row counts as a CSV error; queued jobs are cancelled
+                # so the pool doesn't keep rendering after the run has already failed
+                try:
+                    data = next(rows)
+                except StopIteration:
+                    rows_left = False
+                    continue
+                except (OSError, ValueError, csv.Error) as e:
+                    for future in pending:
+                        future.cancel()
+                    print(f"Error reading CSV file: {e}")
+                    sys.exit(1)
+
+                defines = scad_defines(data["name"], data["params"])
+                key = cache_key(defines)
+                if key in seen_keys:
+                    print(f"Skipping duplicate row: {data['name']}", flush=True)
+                    continue
+                seen_keys.add(key)
+                base = sanitize_filename(data["name"])
+                filename = unique_filename(data["name"], used_filenames)
+                if filename != base:
+                    print(
+                        f"Note: '{data['name']}' has the same filename as '{used_filenames[base.casefold()]}', "
+                        f"writing {filename}.stl instead",
+                        flush=True,
+                    )
+                future = executor.submit(_worker, data["name"], filename, defines, key, output_dir, not args.no_cache)
+                pending[future] = data["name"]
+                continue
+
+            # Print each status as its job finishes, prefixed with a running count
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = pending.pop(future)
+                try:
+                    ok, message = future.result()
+                except Exception as e:
+                    # e.g. a worker process that died; count it instead of aborting the whole run
+                    ok, message = False, f"Generating STL for: {name}... ✗ Error: {e}"
+                if ok:
+                    successful += 1
+                else:
+                    failed += 1
+                print(f"[{successful + failed}] {message}", flush=True)
+
+    if successful + failed == 0:
+        print("Error: No valid names found in CSV file!")
+        sys.exit(1)
 
     # Summary
     print()
@@ -290,7 +553,7 @@ def main():
     print("Generation Complete!")
     print(f"Successful: {successful}")
     print(f"Failed: {failed}")
-    print(f"Output location: {os.path.abspath(OUTPUT_DIR)}")
+    print(f"Output location: {output_dir.resolve()}")
     print("=" * 60)
 
 